@@ -8,19 +8,13 @@
 import os
 import sys
 import json
+import queue
 import threading
+import time
 from pathlib import Path
 
-import win32gui
-import win32con
-import win32api
-
-import customtkinter as ctk
-
-import pystray
-from pystray import MenuItem as Item
-from PIL import Image, ImageDraw
-
+# customtkinter, pystray, PIL and win32com are imported where first needed,
+# so the keyboard hook is installed before any of them are loaded.
 import ctypes
 from ctypes import wintypes
 
@@ -39,15 +33,22 @@ def load_config():
             return {
                 "allowed_monitor": int(data.get("allowed_monitor", 0)),
                 "autostart": bool(data.get("autostart", False)),
+                "ignore_injected": bool(data.get("ignore_injected", True)),
             }
         except Exception:
             pass
-    return {"allowed_monitor": 0, "autostart": False}
+    return {"allowed_monitor": 0, "autostart": False, "ignore_injected": True}
+
+
+CONFIG_SAVE_DELAY = 1.0  # seconds; coalesces bursts of menu clicks
 
 
 def save_config(cfg: dict):
+    # write a temp file and swap it in: a crash mid-write can't corrupt the config
     CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
-    CONFIG_PATH.write_text(json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp = CONFIG_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, CONFIG_PATH)
 
 
 # -----------------------------
@@ -79,6 +80,21 @@ def get_launch_target_and_args():
     return target, args
 
 
+# WScript.Shell COM object, created on first use and reused. Autostart is only
+# toggled from the main (UI) thread, which is where the object lives.
+_wscript_shell = {"obj": None}
+
+# only set_autostart changes the shortcut, so one stat is enough
+_autostart_cache = {"value": None}
+
+
+def get_wscript_shell():
+    if _wscript_shell["obj"] is None:
+        import win32com.client  # comes with pywin32
+        _wscript_shell["obj"] = win32com.client.Dispatch("WScript.Shell")
+    return _wscript_shell["obj"]
+
+
 def set_autostart(enabled: bool):
     try:
         sf = startup_folder()
@@ -86,9 +102,7 @@ def set_autostart(enabled: bool):
 
         lnk = shortcut_path()
         if enabled:
-            import win32com.client  # comes with pywin32
-            shell = win32com.client.Dispatch("WScript.Shell")
-            shortcut = shell.CreateShortCut(str(lnk))
+            shortcut = get_wscript_shell().CreateShortCut(str(lnk))
 
             target, args = get_launch_target_and_args()
             shortcut.Targetpath = target
@@ -100,11 +114,138 @@ def set_autostart(enabled: bool):
             if lnk.exists():
                 lnk.unlink()
     except Exception as e:
+        _autostart_cache["value"] = None  # state unknown, stat again next time
         raise RuntimeError(f"Autostart error: {e}")
+    _autostart_cache["value"] = enabled
 
 
 def is_autostart_enabled() -> bool:
-    return shortcut_path().exists()
+    if _autostart_cache["value"] is None:
+        _autostart_cache["value"] = shortcut_path().exists()
+    return _autostart_cache["value"]
+
+
+# -----------------------------
+# WinAPI (ctypes prototypes, declared once at import time)
+# -----------------------------
+
+user32 = ctypes.WinDLL("user32", use_last_error=True)
+kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+
+ULONG_PTR = ctypes.c_uint64 if ctypes.sizeof(ctypes.c_void_p) == 8 else ctypes.c_uint32
+LRESULT = ctypes.c_ssize_t  # LONG_PTR: pointer-sized on both 32 and 64 bit
+
+GWL_EXSTYLE = -20
+WS_EX_TOOLWINDOW = 0x00000080
+MONITORINFOF_PRIMARY = 0x00000001
+MONITOR_DEFAULTTONULL = 0x00000000
+SW_RESTORE = 9
+SW_FORCEMINIMIZE = 11
+GCW_ATOM = -32
+
+
+class MONITORINFO(ctypes.Structure):
+    _fields_ = [
+        ("cbSize", wintypes.DWORD),
+        ("rcMonitor", wintypes.RECT),
+        ("rcWork", wintypes.RECT),
+        ("dwFlags", wintypes.DWORD),
+    ]
+
+
+MONITORENUMPROC = ctypes.WINFUNCTYPE(
+    wintypes.BOOL, wintypes.HMONITOR, wintypes.HDC, ctypes.POINTER(wintypes.RECT), wintypes.LPARAM
+)
+WNDENUMPROC = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+
+user32.EnumDisplayMonitors.argtypes = (wintypes.HDC, ctypes.POINTER(wintypes.RECT), MONITORENUMPROC, wintypes.LPARAM)
+user32.EnumDisplayMonitors.restype = wintypes.BOOL
+
+user32.GetMonitorInfoW.argtypes = (wintypes.HMONITOR, ctypes.POINTER(MONITORINFO))
+user32.GetMonitorInfoW.restype = wintypes.BOOL
+
+user32.EnumWindows.argtypes = (WNDENUMPROC, wintypes.LPARAM)
+user32.EnumWindows.restype = wintypes.BOOL
+
+user32.IsWindowVisible.argtypes = (wintypes.HWND,)
+user32.IsWindowVisible.restype = wintypes.BOOL
+
+user32.GetWindowLongW.argtypes = (wintypes.HWND, ctypes.c_int)
+user32.GetWindowLongW.restype = wintypes.LONG
+
+user32.IsIconic.argtypes = (wintypes.HWND,)
+user32.IsIconic.restype = wintypes.BOOL
+
+user32.FindWindowW.argtypes = (wintypes.LPCWSTR, wintypes.LPCWSTR)
+user32.FindWindowW.restype = wintypes.HWND
+
+try:
+    _GetClassLongPtrW = user32.GetClassLongPtrW
+except AttributeError:  # 32-bit user32 only exports GetClassLongW
+    _GetClassLongPtrW = user32.GetClassLongW
+_GetClassLongPtrW.argtypes = (wintypes.HWND, ctypes.c_int)
+_GetClassLongPtrW.restype = ctypes.c_size_t
+
+user32.ShowWindow.argtypes = (wintypes.HWND, ctypes.c_int)
+user32.ShowWindow.restype = wintypes.BOOL
+
+user32.ShowWindowAsync.argtypes = (wintypes.HWND, ctypes.c_int)
+user32.ShowWindowAsync.restype = wintypes.BOOL
+
+user32.GetCursorPos.argtypes = (ctypes.POINTER(wintypes.POINT),)
+user32.GetCursorPos.restype = wintypes.BOOL
+
+user32.MonitorFromPoint.argtypes = (wintypes.POINT, wintypes.DWORD)
+user32.MonitorFromPoint.restype = wintypes.HMONITOR
+
+user32.MonitorFromWindow.argtypes = (wintypes.HWND, wintypes.DWORD)
+user32.MonitorFromWindow.restype = wintypes.HMONITOR
+
+WNDPROC = ctypes.WINFUNCTYPE(LRESULT, wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM)
+
+
+class WNDCLASSW(ctypes.Structure):
+    _fields_ = [
+        ("style", wintypes.UINT),
+        ("lpfnWndProc", WNDPROC),
+        ("cbClsExtra", ctypes.c_int),
+        ("cbWndExtra", ctypes.c_int),
+        ("hInstance", wintypes.HINSTANCE),
+        ("hIcon", wintypes.HICON),
+        ("hCursor", wintypes.HANDLE),
+        ("hbrBackground", wintypes.HBRUSH),
+        ("lpszMenuName", wintypes.LPCWSTR),
+        ("lpszClassName", wintypes.LPCWSTR),
+    ]
+
+
+user32.RegisterClassW.argtypes = (ctypes.POINTER(WNDCLASSW),)
+user32.RegisterClassW.restype = wintypes.ATOM
+
+user32.CreateWindowExW.argtypes = (
+    wintypes.DWORD, wintypes.LPCWSTR, wintypes.LPCWSTR, wintypes.DWORD,
+    ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+    wintypes.HWND, wintypes.HMENU, wintypes.HINSTANCE, wintypes.LPVOID,
+)
+user32.CreateWindowExW.restype = wintypes.HWND
+
+user32.DefWindowProcW.argtypes = (wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM)
+user32.DefWindowProcW.restype = LRESULT
+
+user32.PostMessageW.argtypes = (wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM)
+user32.PostMessageW.restype = wintypes.BOOL
+
+user32.PostQuitMessage.argtypes = (ctypes.c_int,)
+user32.PostQuitMessage.restype = None
+
+user32.GetMessageW.argtypes = (ctypes.POINTER(wintypes.MSG), wintypes.HWND, wintypes.UINT, wintypes.UINT)
+user32.GetMessageW.restype = wintypes.BOOL
+
+user32.TranslateMessage.argtypes = (ctypes.POINTER(wintypes.MSG),)
+user32.DispatchMessageW.argtypes = (ctypes.POINTER(wintypes.MSG),)
+
+kernel32.GetModuleHandleW.argtypes = (wintypes.LPCWSTR,)
+kernel32.GetModuleHandleW.restype = wintypes.HINSTANCE
 
 
 # -----------------------------
@@ -112,81 +253,145 @@ def is_autostart_enabled() -> bool:
 # -----------------------------
 
 def get_monitors():
+    # plain (handle, l, t, r, b, primary) tuples: cheap to scan, no dict lookups
     monitors = []
-    for hmon, hdc, rect in win32api.EnumDisplayMonitors(None, None):
-        info = win32api.GetMonitorInfo(hmon)
-        monitors.append({
-            "handle": hmon,
-            "rect": rect,  # (l,t,r,b)
-            "primary": info.get("Flags", 0) == 1
-        })
-    return monitors
-
-
-def rect_info(rect):
-    l, t, r, b = rect
+    info = MONITORINFO()
+    info.cbSize = ctypes.sizeof(MONITORINFO)
+
+    def cb(hmon, hdc, lprect, lparam):
+        r = lprect.contents
+        user32.GetMonitorInfoW(hmon, ctypes.byref(info))
+        monitors.append((hmon, r.left, r.top, r.right, r.bottom, bool(info.dwFlags & MONITORINFOF_PRIMARY)))
+        return True
+
+    user32.EnumDisplayMonitors(None, None, MONITORENUMPROC(cb), 0)
+    return tuple(monitors)
+
+
+def rect_info(m):
+    _, l, t, r, b, _ = m
     return {"x": l, "y": t, "w": r - l, "h": b - t}
 
 
-def point_in_rect(x, y, rect):
-    l, t, r, b = rect
-    return l <= x < r and t <= y < b
+# The OS maps points/windows to an HMONITOR itself; mon_by_hmon turns that
+# into our monitor index.
 
+def get_cursor_monitor_idx(mon_by_hmon, pt=None):
+    if pt is None:
+        pt = wintypes.POINT()
+    if not user32.GetCursorPos(ctypes.byref(pt)):
+        return None
+    return mon_by_hmon.get(user32.MonitorFromPoint(pt, MONITOR_DEFAULTTONULL))
+
+
+WM_DESTROY = 0x0002
+WM_CLOSE = 0x0010
+WM_DISPLAYCHANGE = 0x007E
+WM_SETTINGCHANGE = 0x001A
 
-def get_cursor_monitor_idx(monitors):
-    x, y = win32gui.GetCursorPos()
-    for i, m in enumerate(monitors):
-        if point_in_rect(x, y, m["rect"]):
-            return i
-    return None
+
+class DisplayChangeWatcher:
+    """
+    Hidden top-level window that reports monitor topology changes.
+    (Message-only windows don't receive broadcasts like WM_DISPLAYCHANGE.)
+    """
+    CLASS_NAME = "WinDSingleMonitorDisplayWatcher"
+
+    def __init__(self, on_change):
+        self.on_change = on_change
+        self.hwnd = None
+        self.thread = None
+        # set when the hidden window couldn't be created: changes then go
+        # unnoticed, so callers must not trust a cached monitor list
+        self.error = None
+        self._proc = WNDPROC(self._wndproc)  # keep the trampoline alive
+
+    def _wndproc(self, hwnd, msg, wparam, lparam):
+        if msg == WM_DISPLAYCHANGE or msg == WM_SETTINGCHANGE:
+            self.on_change()
+        elif msg == WM_DESTROY:
+            user32.PostQuitMessage(0)
+            return 0
+        return user32.DefWindowProcW(hwnd, msg, wparam, lparam)
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+
+        def run():
+            hinst = kernel32.GetModuleHandleW(None)
+            wc = WNDCLASSW()
+            wc.hInstance = hinst
+            wc.lpszClassName = self.CLASS_NAME
+            wc.lpfnWndProc = self._proc
+            user32.RegisterClassW(ctypes.byref(wc))  # fails harmlessly if already registered
+            self.hwnd = user32.CreateWindowExW(
+                0, self.CLASS_NAME, APP_NAME, 0,
+                0, 0, 0, 0, None, None, hinst, None
+            )
+            if not self.hwnd:
+                self.error = ctypes.WinError(ctypes.get_last_error())
+                if sys.stderr:
+                    print(f"{APP_NAME}: display change watcher disabled: {self.error}", file=sys.stderr)
+                # let listeners re-check now that the cache is untrusted
+                self.on_change()
+                return
+
+            msg = wintypes.MSG()
+            while user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+                user32.TranslateMessage(ctypes.byref(msg))
+                user32.DispatchMessageW(ctypes.byref(msg))
+            self.hwnd = None
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        try:
+            if self.hwnd:
+                user32.PostMessageW(self.hwnd, WM_CLOSE, 0, 0)
+        except Exception:
+            pass
 
 
 # -----------------------------
 # Window helpers
 # -----------------------------
 
-def is_real_window(hwnd):
-    if not win32gui.IsWindowVisible(hwnd):
+SHELL_WINDOW_CLASSES = ("Progman", "Shell_TrayWnd")
+
+
+def get_shell_class_atoms():
+    # Class atoms of the desktop/taskbar windows, so the per-window check is an
+    # integer compare instead of a GetClassName string round-trip.
+    # Resolved per enumeration: they change when explorer.exe restarts.
+    atoms = set()
+    for cls in SHELL_WINDOW_CLASSES:
+        hwnd = user32.FindWindowW(cls, None)
+        if hwnd:
+            atom = _GetClassLongPtrW(hwnd, GCW_ATOM)
+            if atom:
+                atoms.add(atom)
+    return frozenset(atoms)
+
+
+def is_real_window(hwnd, shell_atoms):
+    # cheapest checks first
+    if not user32.IsWindowVisible(hwnd):
         return False
-    cls = win32gui.GetClassName(hwnd)
-    if cls in ("Progman", "Shell_TrayWnd"):
+    ex = user32.GetWindowLongW(hwnd, GWL_EXSTYLE)
+    if ex & WS_EX_TOOLWINDOW:
         return False
-    ex = win32gui.GetWindowLong(hwnd, win32con.GWL_EXSTYLE)
-    if ex & win32con.WS_EX_TOOLWINDOW:
+    if _GetClassLongPtrW(hwnd, GCW_ATOM) in shell_atoms:
         return False
     return True
 
 
-def get_window_monitor_idx(monitors, hwnd):
-    try:
-        l, t, r, b = win32gui.GetWindowRect(hwnd)
-    except Exception:
-        return None
-    cx = (l + r) // 2
-    cy = (t + b) // 2
-    for i, m in enumerate(monitors):
-        if point_in_rect(cx, cy, m["rect"]):
-            return i
-    return None
+def get_window_monitor_idx(mon_by_hmon, hwnd):
+    return mon_by_hmon.get(user32.MonitorFromWindow(hwnd, MONITOR_DEFAULTTONULL))
 
 
-def enum_windows_on_monitor(monitors, idx):
-    result = []
-
-    def cb(hwnd, _):
-        try:
-            if not is_real_window(hwnd):
-                return
-            mi = get_window_monitor_idx(monitors, hwnd)
-            if mi == idx:
-                placement = win32gui.GetWindowPlacement(hwnd)
-                if placement[1] != win32con.SW_SHOWMINIMIZED:
-                    result.append(hwnd)
-        except Exception:
-            pass
-
-    win32gui.EnumWindows(cb, None)
-    return result
+MAX_ENUM_WINDOWS = 1024
 
 
 # -----------------------------
@@ -196,28 +401,146 @@ def enum_windows_on_monitor(monitors, idx):
 class Controller:
     def __init__(self):
         self.cfg = load_config()
-        self.monitors = get_monitors()
-        self.allowed = int(self.cfg.get("allowed_monitor", 0))
         self.toggled = False
         self.minimized = []
-        self._lock = threading.Lock()
+        # Readers (the Win+D worker) take no lock: they load the immutable
+        # (monitors, mon_by_hmon, allowed) snapshot in one attribute read. The lock
+        # only serializes writers building the next snapshot.
+        self._write_lock = threading.Lock()
+
+        # config persistence has its own lock so disk writes never block
+        # snapshot writers (refresh_monitors on the worker/watcher threads)
+        self._cfg_lock = threading.Lock()
+        self._cfg_dirty = False
+        self._flush_timer = None
+
+        # EnumWindows state, used only from the Win+D worker thread. The
+        # callback trampoline is built once and kept alive on the controller:
+        # a collected WNDENUMPROC crashes EnumWindows, and rebuilding it on
+        # every Win+D is wasted ctypes work.
+        self._enum_buf = (wintypes.HWND * MAX_ENUM_WINDOWS)()
+        self._enum_count = 0
+        self._enum_args = None
+        self._enum_proc = WNDENUMPROC(self._enum_cb)
+        self._cursor_pt = wintypes.POINT()  # reused by every Win+D
+
+        # monitor topology rarely changes: enumerate once, re-enumerate only
+        # after the watcher reports WM_DISPLAYCHANGE / WM_SETTINGCHANGE
+        self._monitors_dirty = False
+        self.on_monitors_changed = None  # called with the new monitor tuple
+        self._state = self._make_state(get_monitors(), max(0, int(self.cfg.get("allowed_monitor", 0))))
+        self._display_watcher = DisplayChangeWatcher(self.invalidate_monitors)
+        self._display_watcher.start()
+
+    @staticmethod
+    def _make_state(monitors, allowed):
+        return monitors, {m[0]: i for i, m in enumerate(monitors)}, allowed
+
+    @property
+    def monitors(self):
+        return self._state[0]
+
+    @property
+    def allowed(self):
+        return self._state[2]
+
+    @property
+    def monitors_trusted(self):
+        # False when display changes can't be observed (watcher failed)
+        return self._display_watcher.error is None
+
+    def invalidate_monitors(self):
+        self._monitors_dirty = True
+        # A listener (the hook's single-monitor bypass) needs the new topology
+        # now: while bypassing, no Win+D reaches us to trigger a lazy refresh.
+        if self.on_monitors_changed:
+            self.refresh_monitors()
 
     def refresh_monitors(self):
-        with self._lock:
-            self.monitors = get_monitors()
+        # without a working watcher the cache can't be trusted: always re-enumerate
+        if not self._monitors_dirty and self.monitors_trusted:
+            return
+        with self._write_lock:
+            self._monitors_dirty = False
+            old_monitors = self._state[0]
+            self._state = self._make_state(get_monitors(), self._state[2])
+        if self._state[0] != old_monitors:
+            # Win+D may have run natively (single-monitor bypass) or windows
+            # moved between screens: the saved restore list is stale
+            self.minimized = []
+            self.toggled = False
+        if self.on_monitors_changed:
+            self.on_monitors_changed(self._state[0])
+
+    def stop(self):
+        self._display_watcher.stop()
 
     def set_allowed(self, idx: int):
-        with self._lock:
-            self.allowed = max(0, idx)
-            self.cfg["allowed_monitor"] = self.allowed
-            save_config(self.cfg)
+        idx = max(0, idx)
+        with self._write_lock:
+            monitors, mon_by_hmon, allowed = self._state
+            if idx == allowed:
+                return
+            self._state = (monitors, mon_by_hmon, idx)
+        with self._cfg_lock:
+            self.cfg["allowed_monitor"] = idx
+        self.schedule_save()
+
+    def set_autostart_pref(self, enabled: bool):
+        with self._cfg_lock:
+            self.cfg["autostart"] = bool(enabled)
+        self.schedule_save()
+
+    def schedule_save(self):
+        # mark the config dirty and (re)start the flush timer
+        with self._cfg_lock:
+            self._cfg_dirty = True
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+            self._flush_timer = threading.Timer(CONFIG_SAVE_DELAY, self.flush_config)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush_config(self):
+        with self._cfg_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._cfg_dirty:
+                return
+            self._cfg_dirty = False
+            try:
+                save_config(self.cfg)
+            except Exception:
+                pass
+
+    def _enum_cb(self, hwnd, _):
+        # No try/except per window: every call below reports failure through its
+        # return value (an unknown HMONITOR -> None monitor) instead of raising.
+        mon_by_hmon, idx, shell_atoms = self._enum_args
+        if not is_real_window(hwnd, shell_atoms) or user32.IsIconic(hwnd):
+            return True
+        if get_window_monitor_idx(mon_by_hmon, hwnd) == idx:
+            # minimize right here (posted, so a hung app can't stall us) and
+            # remember the handle for restore: a single EnumWindows pass
+            user32.ShowWindowAsync(hwnd, SW_FORCEMINIMIZE)
+            n = self._enum_count
+            self._enum_buf[n] = hwnd
+            self._enum_count = n + 1
+            return n + 1 < MAX_ENUM_WINDOWS  # stop once the buffer is full
+        return True
+
+    def _minimize_windows_on_monitor(self, mon_by_hmon, idx):
+        self._enum_args = (mon_by_hmon, idx, get_shell_class_atoms())
+        self._enum_count = 0
+        user32.EnumWindows(self._enum_proc, 0)
+        return self._enum_buf[:self._enum_count]
 
     def toggle_desktop_single_monitor(self):
-        with self._lock:
-            monitors = self.monitors
-            allowed = self.allowed
+        self.refresh_monitors()
+        _, mon_by_hmon, allowed = self._state
 
-        cursor_m = get_cursor_monitor_idx(monitors)
+        cursor_m = get_cursor_monitor_idx(mon_by_hmon, self._cursor_pt)
 
         # Important behavior:
         # We BLOCK Win+D always, to avoid global "show desktop" on both monitors.
@@ -226,20 +549,11 @@ class Controller:
             return
 
         if not self.toggled:
-            wins = enum_windows_on_monitor(monitors, allowed)
-            self.minimized = wins
-            for h in wins:
-                try:
-                    win32gui.ShowWindow(h, win32con.SW_MINIMIZE)
-                except Exception:
-                    pass
+            self.minimized = self._minimize_windows_on_monitor(mon_by_hmon, allowed)
             self.toggled = True
         else:
             for h in reversed(self.minimized):
-                try:
-                    win32gui.ShowWindow(h, win32con.SW_RESTORE)
-                except Exception:
-                    pass
+                user32.ShowWindow(h, SW_RESTORE)
             self.minimized = []
             self.toggled = False
 
@@ -261,12 +575,11 @@ VK_LWIN = 0x5B
 VK_RWIN = 0x5C
 VK_D = 0x44
 
-user32 = ctypes.WinDLL("user32", use_last_error=True)
-kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+LLKHF_LOWER_IL_INJECTED = 0x02
+LLKHF_INJECTED = 0x10
 
-ULONG_PTR = ctypes.c_uint64 if ctypes.sizeof(ctypes.c_void_p) == 8 else ctypes.c_uint32
-LRESULT  = ctypes.c_longlong if ctypes.sizeof(ctypes.c_void_p) == 8 else ctypes.c_long
 
+# Layout reference only: the hook callback reads single fields by offset.
 class KBDLLHOOKSTRUCT(ctypes.Structure):
     _fields_ = [
         ("vkCode", wintypes.DWORD),
@@ -340,49 +653,71 @@ def _send_win_keydown(vk_win: int):
     
 
 
-LowLevelProc = ctypes.WINFUNCTYPE(ctypes.c_longlong, wintypes.INT, wintypes.WPARAM, wintypes.LPARAM)
+LowLevelProc = ctypes.WINFUNCTYPE(LRESULT, wintypes.INT, wintypes.WPARAM, wintypes.LPARAM)
 
 user32.SetWindowsHookExW.argtypes = (wintypes.INT, LowLevelProc, wintypes.HINSTANCE, wintypes.DWORD)
 user32.SetWindowsHookExW.restype = wintypes.HHOOK
 
 user32.CallNextHookEx.argtypes = (wintypes.HHOOK, wintypes.INT, wintypes.WPARAM, wintypes.LPARAM)
 user32.CallNextHookEx.restype = LRESULT
+_CallNextHookEx = user32.CallNextHookEx  # bound once: called for every keystroke
+_c_uint32 = ctypes.c_uint32
 
 user32.UnhookWindowsHookEx.argtypes = (wintypes.HHOOK,)
 user32.UnhookWindowsHookEx.restype = wintypes.BOOL
 
-user32.GetMessageW.argtypes = (ctypes.POINTER(wintypes.MSG), wintypes.HWND, wintypes.UINT, wintypes.UINT)
-user32.GetMessageW.restype = wintypes.BOOL
-
-user32.TranslateMessage.argtypes = (ctypes.POINTER(wintypes.MSG),)
-user32.DispatchMessageW.argtypes = (ctypes.POINTER(wintypes.MSG),)
-
 user32.PostThreadMessageW.argtypes = (wintypes.DWORD, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM)
 user32.PostThreadMessageW.restype = wintypes.BOOL
 
-kernel32.GetModuleHandleW.argtypes = (wintypes.LPCWSTR,)
-kernel32.GetModuleHandleW.restype = wintypes.HINSTANCE
-
 kernel32.GetCurrentThreadId.restype = wintypes.DWORD
 
+user32.MsgWaitForMultipleObjectsEx.argtypes = (
+    wintypes.DWORD, ctypes.POINTER(wintypes.HANDLE), wintypes.DWORD, wintypes.DWORD, wintypes.DWORD
+)
+user32.MsgWaitForMultipleObjectsEx.restype = wintypes.DWORD
+
+user32.PeekMessageW.argtypes = (ctypes.POINTER(wintypes.MSG), wintypes.HWND, wintypes.UINT, wintypes.UINT, wintypes.UINT)
+user32.PeekMessageW.restype = wintypes.BOOL
+
 WM_QUIT = 0x0012
+PM_REMOVE = 0x0001
+QS_ALLINPUT = 0x04FF
+MWMO_ALERTABLE = 0x0002
+MWMO_INPUTAVAILABLE = 0x0004
+
+# Windows silently removes LL hooks that time out (and other software can push
+# ours down the chain), so the hook is reinstalled periodically: the newest hook
+# is first in the chain.
+HOOK_RENEW_INTERVAL_MS = 1000
 
 
 class WinDHook:
     """
     Blocks only Win+D. Everything else (Win+R etc.) passes normally.
     """
-    def __init__(self, on_win_d):
+    def __init__(self, on_win_d, ignore_injected=True):
         self.on_win_d = on_win_d
+        # skip synthetic keystrokes (SendInput, AutoHotkey, our own input)
+        self._injected_mask = (LLKHF_INJECTED | LLKHF_LOWER_IL_INJECTED) if ignore_injected else 0
         self.hook = None
         self.thread = None
         self.thread_id = None
+        self._stopping = False
+
+        # Set while only one monitor is attached: "this monitor only" is then
+        # exactly the native Win+D, so the hook lets it through untouched.
+        self._fast_bypass = False
 
         self._win_down = False
         self._win_vk = None
         self._suppress_d_up = False
         self._close_start_on_win_up = False
-        
+
+        # Win+D work is handed off to a worker so the hook callback returns
+        # immediately (Windows drops LL hooks that exceed LowLevelHooksTimeout)
+        self._queue = queue.SimpleQueue()
+        self._worker = None
+
         self._proc = LowLevelProc(self._callback)
 
     def _flush_pending_win(self):
@@ -397,44 +732,74 @@ class WinDHook:
         _send_win_keydown(vk)
 
     def _callback(self, nCode, wParam, lParam):
+        # hhk is ignored by CallNextHookEx, so pass NULL instead of self.hook
         if nCode < 0:
-            return user32.CallNextHookEx(self.hook, nCode, wParam, lParam)
+            return _CallNextHookEx(None, nCode, wParam, lParam)
+
+        # read KBDLLHOOKSTRUCT.vkCode (offset 0) without building a struct view
+        vk = _c_uint32.from_address(lParam).value
+
+        # Fast path for almost every keystroke: not Win, no Win+D in progress
+        if vk != VK_LWIN and vk != VK_RWIN and not self._win_down and not self._suppress_d_up:
+            return _CallNextHookEx(None, nCode, wParam, lParam)
 
-        kbd = ctypes.cast(lParam, ctypes.POINTER(KBDLLHOOKSTRUCT)).contents
-        vk = int(kbd.vkCode)
+        # KBDLLHOOKSTRUCT.flags lives at offset 8. Injected input may never
+        # start a Win+D, but its key-ups still reset our state: a synthetic
+        # Win up (AutoHotkey, remappers) must not leave Win "stuck" down.
+        injected = _c_uint32.from_address(lParam + 8).value & self._injected_mask
 
-        is_down = wParam in (WM_KEYDOWN, WM_SYSKEYDOWN)
-        is_up   = wParam in (WM_KEYUP, WM_SYSKEYUP)
+        # WM_SYSKEYDOWN/UP are WM_KEYDOWN/UP with bit 0x4 set
+        msg = wParam | 4
+        is_down = msg == WM_SYSKEYDOWN
+        is_up = msg == WM_SYSKEYUP
 
         # Track Win key state, but DO NOT swallow it (so Win+R etc. works)
-        if vk in (VK_LWIN, VK_RWIN):
+        if vk == VK_LWIN or vk == VK_RWIN:
             if is_down:
-                self._win_down = True
+                if not injected:
+                    self._win_down = True
             elif is_up:
                 self._win_down = False
-            return user32.CallNextHookEx(self.hook, nCode, wParam, lParam)
+            return _CallNextHookEx(None, nCode, wParam, lParam)
 
         # Handle Win + D: swallow D so Windows doesn't do global Show Desktop
-        if self._win_down and vk == VK_D and is_down:
-            try:
-                self.on_win_d()
-            except Exception:
-                pass
-
+        if self._win_down and vk == VK_D and is_down and not injected:
+            if self._fast_bypass:
+                return _CallNextHookEx(None, nCode, wParam, lParam)
+            self._queue.put(1)
             self._suppress_d_up = True
             return 1  # swallow D down
 
-        # Swallow D up (optional)
+        # Swallow D up (optional); an injected D up just clears the flag
         if self._suppress_d_up and vk == VK_D and is_up:
             self._suppress_d_up = False
-            return 1
+            if not injected:
+                return 1
+
+        return _CallNextHookEx(None, nCode, wParam, lParam)
 
-        return user32.CallNextHookEx(self.hook, nCode, wParam, lParam)
+    def set_fast_bypass(self, enabled: bool):
+        self._fast_bypass = bool(enabled)
+
+    def _work(self):
+        while True:
+            if self._queue.get() is None:
+                break
+            try:
+                self.on_win_d()
+            except Exception:
+                pass
 
     def start(self):
         if self.thread and self.thread.is_alive():
             return
 
+        if not (self._worker and self._worker.is_alive()):
+            self._worker = threading.Thread(target=self._work, daemon=True)
+            self._worker.start()
+
+        self._stopping = False
+
         def run():
             # install hook in this thread
             self.thread_id = kernel32.GetCurrentThreadId()
@@ -444,10 +809,23 @@ class WinDHook:
                 raise OSError("Failed to install keyboard hook")
 
             msg = wintypes.MSG()
-            # message loop (required)
-            while user32.GetMessageW(ctypes.byref(msg), None, 0, 0) != 0:
-                user32.TranslateMessage(ctypes.byref(msg))
-                user32.DispatchMessageW(ctypes.byref(msg))
+            renew_at = time.monotonic() + HOOK_RENEW_INTERVAL_MS / 1000
+            running = True
+            # message loop (required); wakes at least once per interval
+            while running and not self._stopping:
+                user32.MsgWaitForMultipleObjectsEx(
+                    0, None, HOOK_RENEW_INTERVAL_MS, QS_ALLINPUT, MWMO_ALERTABLE | MWMO_INPUTAVAILABLE
+                )
+                while user32.PeekMessageW(ctypes.byref(msg), None, 0, 0, PM_REMOVE):
+                    if msg.message == WM_QUIT:
+                        running = False
+                        break
+                    user32.TranslateMessage(ctypes.byref(msg))
+                    user32.DispatchMessageW(ctypes.byref(msg))
+
+                if running and time.monotonic() >= renew_at:
+                    self._renew_hook(hinst)
+                    renew_at = time.monotonic() + HOOK_RENEW_INTERVAL_MS / 1000
 
             # cleanup
             if self.hook:
@@ -457,13 +835,26 @@ class WinDHook:
         self.thread = threading.Thread(target=run, daemon=True)
         self.thread.start()
 
+    def _renew_hook(self, hinst):
+        # install the new hook before removing the old one, so there is no gap
+        new_hook = user32.SetWindowsHookExW(WH_KEYBOARD_LL, self._proc, hinst, 0)
+        if not new_hook:
+            return  # keep the current hook
+        old_hook, self.hook = self.hook, new_hook
+        if old_hook:
+            user32.UnhookWindowsHookEx(old_hook)
+
     def stop(self):
-        # request the hook thread to quit its message loop
+        # request the hook thread to quit its message loop; the flag covers a
+        # WM_QUIT posted before the thread had a message queue
+        self._stopping = True
         try:
             if self.thread_id:
                 user32.PostThreadMessageW(self.thread_id, WM_QUIT, 0, 0)
         except Exception:
             pass
+        # wake the worker so it can exit
+        self._queue.put(None)
 
 
 # -----------------------------
@@ -471,9 +862,10 @@ class WinDHook:
 # -----------------------------
 
 class SettingsWindow:
-    def __init__(self, ctrl: Controller, on_close_callback):
+    def __init__(self, ctrl: Controller):
+        import customtkinter as ctk
+
         self.ctrl = ctrl
-        self.on_close_callback = on_close_callback
 
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("dark-blue")
@@ -495,6 +887,7 @@ class SettingsWindow:
         )
         subtitle.pack(pady=(0, 10))
 
+        self._rendered_monitors = None
         self.mon_text = ctk.CTkTextbox(self.root, width=600, height=260)
         self.mon_text.pack(pady=(0, 10))
         self.mon_text.configure(state="normal")
@@ -536,19 +929,25 @@ class SettingsWindow:
 
     def render_monitors(self):
         self.ctrl.refresh_monitors()
-        self.mon_text.delete("1.0", "end")
+        monitors = self.ctrl.monitors
+        # compare by value: Refresh re-enumerates into a fresh but equal tuple
+        if monitors == self._rendered_monitors:
+            return
+        self._rendered_monitors = monitors
 
-        for i, m in enumerate(self.ctrl.monitors):
-            r = rect_info(m["rect"])
-            primary = " (PRIMARY)" if m.get("primary") else ""
-            self.mon_text.insert("end", f"Monitor {i+1}{primary}\n")
-            self.mon_text.insert("end", f"  Resolution: {r['w']}x{r['h']}\n")
-            self.mon_text.insert("end", f"  Position: x={r['x']} y={r['y']} → x={r['x']+r['w']} y={r['y']+r['h']}\n\n")
+        parts = []
+        for i, m in enumerate(monitors):
+            r = rect_info(m)
+            primary = " (PRIMARY)" if m[5] else ""
+            parts.append(f"Monitor {i+1}{primary}\n")
+            parts.append(f"  Resolution: {r['w']}x{r['h']}\n")
+            parts.append(f"  Position: x={r['x']} y={r['y']} → x={r['x']+r['w']} y={r['y']+r['h']}\n\n")
 
-        self.mon_text.insert(
-            "end",
-            "Подсказка:\n- меньший x = монитор левее\n- отрицательный y = монитор выше основного\n"
-        )
+        parts.append("Подсказка:\n- меньший x = монитор левее\n- отрицательный y = монитор выше основного\n")
+
+        # one insert = one widget update
+        self.mon_text.delete("1.0", "end")
+        self.mon_text.insert("end", "".join(parts))
 
     def on_monitor_change(self, value: str):
         try:
@@ -561,13 +960,14 @@ class SettingsWindow:
         enabled = bool(self.autostart_var.get())
         try:
             set_autostart(enabled)
-            self.ctrl.cfg["autostart"] = enabled
-            save_config(self.ctrl.cfg)
+            self.ctrl.set_autostart_pref(enabled)
         except Exception as e:
             self.autostart_var.set(is_autostart_enabled())
             self.show_error(str(e))
 
     def on_refresh(self):
+        # explicit user request: re-enumerate even if no change was reported
+        self.ctrl.invalidate_monitors()
         self.mon_text.configure(state="normal")
         self.render_monitors()
         self.mon_text.configure(state="disabled")
@@ -577,6 +977,8 @@ class SettingsWindow:
         self.monitor_var.set(str(min(current, len(self.ctrl.monitors) or 1)))
 
     def show_error(self, msg: str):
+        import customtkinter as ctk
+
         top = ctk.CTkToplevel(self.root)
         top.title("Error")
         top.geometry("520x160")
@@ -597,43 +999,83 @@ class SettingsWindow:
             self.root.destroy()
         except Exception:
             pass
-        self.on_close_callback()
 
 
 # -----------------------------
 # Tray
 # -----------------------------
 
+# 64x64 RGBA tray icon, pre-rendered (zlib + base85) so startup needs neither
+# ImageDraw nor font loading. It was produced with:
+#   img = Image.new("RGBA", (64, 64), (0, 0, 0, 0))
+#   d = ImageDraw.Draw(img)
+#   d.rounded_rectangle((10, 12, 54, 52), radius=10, outline=(255, 255, 255, 255), width=3)
+#   d.text((18, 24), "D", fill=(255, 255, 255, 255))
+#   base64.b85encode(zlib.compress(img.tobytes(), 9))
+TRAY_ICON_SIZE = (64, 64)
+_TRAY_ICON_RGBA_B85 = (
+    b"c-rlnF%E)25JhP$jFo5c0D1)qdrnDbw1C8W&{$g0!Y?drG&au8=D(Nx1VRGymd!%4(=-4800"
+    b"000zq1s?)w}dKED0&;o@M?;KQrU{<K!M$TUPgo`ZB-!h#IrI|GQ57@y8#3{6F7UmuBUrT$NG"
+    b"j%>18k$2;YsoE`mN=Lcml_TMNEWB;u(8T%iV-gN!jD|h8&`u!V}mj568@y8#3{PD*hfBf;U+"
+    b"uw2jr-nHYx&P_7|C@CTO7}oG^?!VOHa$@E!8v&Y00000)W!;-dNuz"
+)
+
+
 def make_tray_icon_image():
-    img = Image.new("RGBA", (64, 64), (0, 0, 0, 0))
-    d = ImageDraw.Draw(img)
-    d.rounded_rectangle((10, 12, 54, 52), radius=10, outline=(255, 255, 255, 255), width=3)
-    d.text((18, 24), "D", fill=(255, 255, 255, 255))
-    return img
+    import base64
+    import zlib
+    from PIL import Image
+
+    rgba = zlib.decompress(base64.b85decode(_TRAY_ICON_RGBA_B85))
+    return Image.frombytes("RGBA", TRAY_ICON_SIZE, rgba)
 
 
 def run_app():
     ctrl = Controller()
 
     # WinAPI hook (blocks only Win+D)
-    hook = WinDHook(on_win_d=ctrl.toggle_desktop_single_monitor)
+    hook = WinDHook(
+        on_win_d=ctrl.toggle_desktop_single_monitor,
+        ignore_injected=ctrl.cfg.get("ignore_injected", True),
+    )
     hook.start()
 
-    settings_window_holder = {"open": False}
+    def on_monitors_changed(monitors):
+        # an untrusted list could hide a newly plugged-in monitor forever
+        # while bypassing, since no Win+D would reach us to refresh it
+        hook.set_fast_bypass(len(monitors) == 1 and ctrl.monitors_trusted)
 
-    def open_settings():
-        if settings_window_holder["open"]:
-            return
-        settings_window_holder["open"] = True
+    ctrl.on_monitors_changed = on_monitors_changed
+    # forced refresh: also catches a display change that happened before the
+    # listener was registered (it only set the dirty flag)
+    ctrl.invalidate_monitors()
 
-        def on_close():
-            settings_window_holder["open"] = False
+    # tray dependencies load only once the hook is already live
+    import pystray
+    from pystray import MenuItem as Item
 
-        def ui_thread():
-            win = SettingsWindow(ctrl, on_close)
-            win.run()
+    # Tk lives on the main thread; tray callbacks (tray thread) post requests
+    # here. None means "exit".
+    ui_requests = queue.SimpleQueue()
+    # "pending" is set from the click until the window closes (building it
+    # is slow: the first open also imports customtkinter), so repeated
+    # clicks don't queue extra windows.
+    settings_window_holder = {"win": None, "pending": False, "exiting": False}
 
-        threading.Thread(target=ui_thread, daemon=True).start()
+    def open_settings():
+        if settings_window_holder["exiting"]:
+            return
+        win = settings_window_holder["win"]
+        if win is not None:
+            try:
+                win.root.after(0, win.root.lift)
+            except Exception:
+                pass
+            return
+        if settings_window_holder["pending"]:
+            return
+        settings_window_holder["pending"] = True
+        ui_requests.put("open")
 
     def set_monitor_1():
         ctrl.set_allowed(0)
@@ -642,12 +1084,25 @@ def run_app():
         ctrl.set_allowed(1)
 
     def exit_app(icon, item):
+        # unblock the main thread first, whatever happens below
+        settings_window_holder["exiting"] = True
+        ui_requests.put(None)
+
         try:
             hook.stop()
         except Exception:
             pass
+        ctrl.flush_config()
+        ctrl.stop()
         icon.stop()
 
+        win = settings_window_holder["win"]
+        if win is not None:
+            try:
+                win.root.after(0, win.close)
+            except Exception:
+                pass  # root already destroyed
+
     icon = pystray.Icon(
         APP_NAME,
         make_tray_icon_image(),
@@ -670,7 +1125,27 @@ def run_app():
     except Exception:
         pass
 
-    icon.run()
+    icon.run_detached()
+
+    while ui_requests.get() is not None:
+        if settings_window_holder["exiting"]:
+            break
+        # a failing UI (e.g. broken customtkinter) must not end this loop:
+        # it is the only consumer of ui_requests
+        try:
+            win = SettingsWindow(ctrl)
+            settings_window_holder["win"] = win
+            # Exit may have been clicked while the window was being built
+            if settings_window_holder["exiting"]:
+                win.close()
+                break
+            win.run()
+        except Exception as e:
+            if sys.stderr:
+                print(f"{APP_NAME}: settings window error: {e}", file=sys.stderr)
+        finally:
+            settings_window_holder["win"] = None
+            settings_window_holder["pending"] = False
 
 
 if __name__ == "__main__":